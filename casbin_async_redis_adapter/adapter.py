@@ -1,9 +1,76 @@
+import asyncio
 import json
+import logging
+import sys
+from collections import Counter
 
 import redis.asyncio as redis
 from casbin import persist
 from casbin.persist.adapters.asyncio import AsyncAdapter
 
+from .snapshot import read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+UPDATE_POLICY_SCRIPT = """
+    local old_rule_json = ARGV[1]
+    local new_rule_json = ARGV[2]
+    local rules = redis.call('lrange', KEYS[1], 0, -1)
+    for i, rule_json in ipairs(rules) do
+        local rule = cjson.decode(rule_json)
+        if rule.ptype == ARGV[3] and rule_json == old_rule_json then
+            redis.call('lset', KEYS[1], i-1, new_rule_json)
+            return redis.call('incr', KEYS[2])
+        end
+    end
+    return 0
+    """
+
+# ARGV: ptype, field index, field values. An empty field value matches anything,
+# as in casbin's model. Returns the new version followed by the removed lines.
+REMOVE_FILTERED_POLICY_SCRIPT = """
+    local field_index = tonumber(ARGV[2])
+    local rules = redis.call('lrange', KEYS[1], 0, -1)
+    local result = {}
+    for i, rule_json in ipairs(rules) do
+        local rule = cjson.decode(rule_json)
+        local is_match = rule.ptype == ARGV[1]
+        for j = 3, #ARGV do
+            if not is_match then
+                break
+            end
+            local value = rule['v' .. (field_index + j - 3)]
+            is_match = type(value) == 'string' and (ARGV[j] == '' or ARGV[j] == value)
+        end
+        if is_match then
+            redis.call('lset', KEYS[1], i - 1, '__CASBIN_DELETED__')
+            table.insert(result, rule_json)
+        end
+    end
+    redis.call('lrem', KEYS[1], 0, '__CASBIN_DELETED__')
+    table.insert(result, 1, redis.call('incr', KEYS[2]))
+    return result
+    """
+
+# ARGV: expected version, number of rules to remove, rules to remove, rules to add.
+# Returns the new version, or false if the stored policy is not at the expected
+# version. Each removal drops one copy of the rule, like the model's multiset.
+SAVE_POLICY_DIFF_SCRIPT = """
+    if (redis.call('get', KEYS[2]) or '0') ~= ARGV[1] then
+        return false
+    end
+    local removed = tonumber(ARGV[2])
+    for i = 3, removed + 2 do
+        redis.call('lrem', KEYS[1], 1, ARGV[i])
+    end
+    for i = removed + 3, #ARGV do
+        redis.call('rpush', KEYS[1], ARGV[i])
+    end
+    return redis.call('incr', KEYS[2])
+    """
+
+SAVE_POLICY_DIFF_RETRIES = 5
+
 
 class CasbinRule:
     """
@@ -41,20 +108,101 @@ class CasbinRule:
         return '<CasbinRule :"{}">'.format(str(self))
 
 
+def _merge_pushes(ops):
+    """Return [(command, values)] for ops, merging consecutive pushes into one RPUSH."""
+    commands = []
+    for command, value in ops:
+        if command == "rpush" and commands and commands[-1][0] == "rpush":
+            commands[-1][1].append(value)
+        else:
+            commands.append((command, [value]))
+    return commands
+
+
+class _Batch:
+    """Auto-Save mutations buffered during one batch window."""
+
+    def __init__(self, future):
+        self.future = future
+        # every caller may have been cancelled by the time the commit fails;
+        # the failure is theirs, so keep asyncio from logging it as unhandled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.timer = None
+        self.commit = None
+        self.count = 0
+        # live ops in insertion order, and the keys of the live ops per rule
+        self.ops = {}
+        self.positions = {}
+
+    def add(self, command, value):
+        self.count += 1
+        if command == "lrem":
+            # LREM drops every copy of the rule, so earlier pushes and
+            # removals of the same rule in this window are redundant
+            for position in self.positions.pop(value, ()):
+                del self.ops[position]
+        self.ops[self.count] = (command, value)
+        self.positions.setdefault(value, []).append(self.count)
+
+    def commands(self):
+        """Return the live ops as [(command, values)]."""
+        return _merge_pushes(self.ops.values())
+
+
 class Adapter(AsyncAdapter):
     """the interface for Casbin adapters."""
 
+    # seconds between reconcile attempts while redis is unreachable
+    reconcile_backoff = 0.5
+    reconcile_backoff_max = 30.0
+
     def __init__(
         self,
-        host,
-        port,
+        host="localhost",
+        port=6379,
         db=0,
         username=None,
         password=None,
         key="casbin_rules",
+        client=None,
+        batch_interval=None,
+        batch_size=None,
+        snapshot_path=None,
+        on_stale_snapshot=None,
+        intern_strings=False,
         **kwargs,
     ):
         self.key = key
+        # policy version, incremented by every write of this adapter in the
+        # same transaction as the write itself
+        self.version_key = f"{key}:version"
+        # write-behind Auto-Save: buffer mutations for batch_interval seconds
+        # (or until batch_size of them are pending) and commit them together
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self._batch = None
+        self._flush_lock = None
+        self._last_commit = None
+        # local policy snapshot, written by every load. It is used for the
+        # first load and when redis is down only if on_stale_snapshot is set,
+        # which is awaited when redis turns out to hold a newer policy
+        self.snapshot_path = snapshot_path
+        self.on_stale_snapshot = on_stale_snapshot
+        self.reconcile_task = None
+        self._snapshot_checked = False
+        # intern rule fields and append them to the model directly, so that
+        # values repeated across rules share one string object
+        self.intern_strings = intern_strings
+        # stored rule lines and their version, the base that save_policy_diff
+        # diffs against. Only kept once save_policy_diff has been used, then
+        # refreshed by load_policy and advanced by this adapter's own writes
+        self._stored = None
+        self._stored_version = None
+        if client is not None:
+            # any object speaking the redis.asyncio command subset used
+            # below, e.g. casbin_async_redis_adapter.fake.FakeRedis
+            self.client = client
+            return
         self.client = redis.Redis(
             host=host,
             port=port,
@@ -66,7 +214,10 @@ class Adapter(AsyncAdapter):
         )
 
     async def drop_table(self):
-        await self.client.delete(self.key)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key).incr(self.version_key)
+            results = await pipe.execute()
+        self._track(results[-1], [("delete", None)])
 
     async def load_policy(self, model):
         """Implementing add Interface for casbin. Load all policy rules from redis
@@ -75,30 +226,226 @@ class Adapter(AsyncAdapter):
             model (CasbinRule): CasbinRule object
         """
 
-        length = await self.client.llen(self.key)
-        for i in range(length):
-            line = await self.client.lindex(self.key, i)
-            line = json.loads(line)
-            rule = CasbinRule(**line)
-            persist.load_policy_line(str(rule), model)
+        await self.flush()
+        if self._serves_snapshot() and not self._snapshot_checked:
+            self._snapshot_checked = True
+            snapshot = read_snapshot(self.snapshot_path)
+            if snapshot is not None:
+                self._load_snapshot(snapshot, model)
+                return
+
+        try:
+            version, lines = await self._load_lines()
+        except (redis.ConnectionError, redis.TimeoutError):
+            snapshot = self._serves_snapshot() and read_snapshot(self.snapshot_path)
+            if not snapshot:
+                raise
+            self._load_snapshot(snapshot, model)
+            return
+
+        if self._stored is not None:
+            self._stored, self._stored_version = Counter(lines), version
+        rules = map(self._decode, lines)
+        if self.snapshot_path is not None:
+            rules = list(rules)
+            self._write_snapshot(version, rules)
+        self._load_rules(rules, model)
+
+    def _serves_snapshot(self):
+        # a snapshot may be out of date, so it is only enforced when the
+        # enforcer can be told to reload once reconcile finds it stale
+        return self.snapshot_path is not None and self.on_stale_snapshot is not None
+
+    def _load_snapshot(self, snapshot, model):
+        version, rules = snapshot
+        self._load_rules(rules, model)
+        if self.reconcile_task is None or self.reconcile_task.done():
+            self.reconcile_task = asyncio.ensure_future(self.reconcile(version))
+
+    def _track(self, version, ops):
+        """Apply a write of this adapter, now at version, to the diff base."""
+        if self._stored is None:
+            return
+        if version != self._stored_version + 1:
+            # somebody else wrote in between
+            self._stored = None
+            return
+        for command, value in ops:
+            if command == "rpush":
+                self._stored[value] += 1
+            elif command == "lrem":
+                del self._stored[value]
+            elif command == "lrem1":
+                self._stored[value] -= 1
+                if self._stored[value] <= 0:
+                    del self._stored[value]
+            else:
+                self._stored.clear()
+        self._stored_version = version
+
+    async def _get_version(self):
+        return int(await self.client.get(self.version_key) or 0)
+
+    async def _load_lines(self):
+        """Read the policy version and all stored rule lines in one transaction."""
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.get(self.version_key).lrange(self.key, 0, -1)
+            version, lines = await pipe.execute()
+        return int(version or 0), lines
+
+    def _decode(self, line):
+        """Decode a stored rule into [ptype, v0, v1, ...], ordered as CasbinRule.dict()."""
+        line = json.loads(line)
+        rule = [line.get("ptype")]
+        for key in sorted(line):
+            if key[:1] == "v" and key[1:].isnumeric() and line[key] is not None:
+                rule.append(line[key])
+        return rule
+
+    def _load_rules(self, rules, model):
+        if not self.intern_strings:
+            for rule in rules:
+                persist.load_policy_line(str(CasbinRule(*rule)), model)
+            return
+
+        # unlike persist.load_policy_line, field values are kept verbatim
+        # instead of being re-split on commas and stripped
+        for ptype, *values in rules:
+            sec = ptype[:1]
+            if sec in model.model and ptype in model.model[sec]:
+                model.model[sec][ptype].policy.append(
+                    [sys.intern(value) for value in values]
+                )
+
+    def _write_snapshot(self, version, rules):
+        try:
+            write_snapshot(self.snapshot_path, version, rules)
+        except OSError:
+            # the snapshot is only a cache, never fail a load because of it
+            pass
+
+    async def reconcile(self, version):
+        """Compare the policy in redis with a snapshot version.
+
+        When redis holds a different version, refreshes the snapshot file and
+        awaits on_stale_snapshot. Both steps are retried with exponential
+        backoff until they succeed, so a served snapshot is never left stale.
 
-    async def _save_policy_line(self, ptype, rule):
+        Returns:
+            bool: True if the snapshot is current, False if it was stale
+        """
+        delay = self.reconcile_backoff
+        stale = False
+        while True:
+            try:
+                if not stale:
+                    if await self._get_version() == version:
+                        return True
+                    version, lines = await self._load_lines()
+                    self._write_snapshot(
+                        version, [self._decode(line) for line in lines]
+                    )
+                    stale = True
+                if self.on_stale_snapshot is not None:
+                    await self.on_stale_snapshot()
+                return False
+            except (redis.ConnectionError, redis.TimeoutError):
+                pass
+            except Exception:
+                logger.exception("on_stale_snapshot failed, retrying")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconcile_backoff_max)
+
+    def _rule_json(self, ptype, rule):
         line = CasbinRule(ptype=ptype)
         for index, value in enumerate(rule):
             setattr(line, f"v{index}", value)
-        await self.client.rpush(self.key, json.dumps(line.dict()))
+        return json.dumps(line.dict())
 
-    async def _delete_policy_lines(self, ptype, rule):
-        line = CasbinRule(ptype=ptype)
-        for index, value in enumerate(rule):
-            setattr(line, f"v{index}", value)
+    async def _write(self, ops):
+        """Apply (command, rule_json) mutations, buffering them in batch mode.
 
-        # if rule is empty, do nothing
-        # else find all given rules and delete them
-        if len(line.dict()) == 0:
-            return 0
-        else:
-            await self.client.lrem(self.key, 0, json.dumps(line.dict()))
+        In batch mode this returns once the batch holding the mutations has
+        been committed, and raises if that commit failed.
+        """
+        if not ops:
+            return
+        if self.batch_interval is None:
+            async with self.client.pipeline(transaction=True) as pipe:
+                self._queue_commands(pipe, _merge_pushes(ops))
+                results = await pipe.execute()
+            self._track(results[-1], ops)
+            return
+
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = _Batch(asyncio.get_running_loop().create_future())
+            batch.timer = asyncio.ensure_future(self._flush_later(batch))
+        for command, value in ops:
+            batch.add(command, value)
+        if self.batch_size is not None and batch.count >= self.batch_size:
+            self._start_commit(batch)
+        await asyncio.shield(batch.future)
+
+    def _queue_commands(self, pipe, commands):
+        for command, values in commands:
+            if command == "rpush":
+                pipe.rpush(self.key, *values)
+            else:
+                pipe.lrem(self.key, 0, values[0])
+        pipe.incr(self.version_key)
+
+    async def _flush_later(self, batch):
+        await asyncio.sleep(self.batch_interval)
+        self._start_commit(batch)
+
+    def _start_commit(self, batch):
+        """Commit a batch in its own task, so that cancelling a caller waiting
+        for it can neither abort the commit nor leave the batch unresolved."""
+        if self._batch is batch:
+            self._batch = None
+        if batch.commit is None:
+            if batch.timer is not asyncio.current_task():
+                batch.timer.cancel()
+            batch.commit = asyncio.ensure_future(self._commit(batch))
+            self._last_commit = batch.future
+        return batch.future
+
+    async def _commit(self, batch):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            try:
+                async with self.client.pipeline(transaction=True) as pipe:
+                    self._queue_commands(pipe, batch.commands())
+                    results = await pipe.execute()
+                self._track(results[-1], batch.ops.values())
+            except asyncio.CancelledError:
+                batch.future.cancel()
+                raise
+            except Exception as e:
+                batch.future.set_exception(e)
+            else:
+                batch.future.set_result(True)
+
+    async def flush(self):
+        """Commit buffered Auto-Save mutations now and wait until they land.
+
+        A no-op unless batch_interval is set. Never raises a failed commit:
+        that error is raised to the callers whose mutations were in the batch.
+        """
+        if self._batch is not None:
+            self._start_commit(self._batch)
+        if self._last_commit is not None and not self._last_commit.done():
+            # commits run in order, so once the last one is done all are;
+            # asyncio.wait neither raises its error nor cancels it with us
+            await asyncio.wait([self._last_commit])
+
+    async def _save_policy_line(self, ptype, rule):
+        await self._write([("rpush", self._rule_json(ptype, rule))])
+
+    async def _delete_policy_lines(self, ptype, rule):
+        await self._write([("lrem", self._rule_json(ptype, rule))])
 
     async def save_policy(self, model) -> bool:
         """Implement add Interface for casbin. Save the policy in redis
@@ -109,14 +456,66 @@ class Adapter(AsyncAdapter):
         Returns:
             bool: True if succeed
         """
+        ops = []
         for sec in ["p", "g"]:
             if sec not in model.model.keys():
                 continue
             for ptype, ast in model.model[sec].items():
                 for rule in ast.policy:
-                    await self._save_policy_line(ptype, rule)
+                    ops.append(("rpush", self._rule_json(ptype, rule)))
+        await self._write(ops)
         return True
 
+    async def save_policy_diff(self, model):
+        """Save the policy in redis by writing only the rules that changed.
+
+        The model is diffed against the stored rules the adapter keeps track of
+        (fetched on the first call), and the adds and removes are applied in
+        one script that first checks the version counter is unchanged. If it
+        is not, the stored rules are fetched again and the diff is retried.
+
+        Args:
+            model (Class Model): Casbin Model which loads from .conf file usually.
+
+        Returns:
+            dict: "added" and "removed" rules, each as [ptype, v0, v1, ...]
+        """
+        await self.flush()
+        desired = Counter()
+        for sec in ["p", "g"]:
+            if sec not in model.model.keys():
+                continue
+            for ptype, ast in model.model[sec].items():
+                for rule in ast.policy:
+                    desired[self._rule_json(ptype, rule)] += 1
+
+        for _ in range(SAVE_POLICY_DIFF_RETRIES):
+            if self._stored is None:
+                self._stored_version, lines = await self._load_lines()
+                self._stored = Counter(lines)
+            removed = list((self._stored - desired).elements())
+            added = list((desired - self._stored).elements())
+            version = await self.client.eval(
+                SAVE_POLICY_DIFF_SCRIPT,
+                2,
+                self.key,
+                self.version_key,
+                str(self._stored_version),
+                len(removed),
+                *removed,
+                *added,
+            )
+            if version:
+                self._stored = desired
+                self._stored_version = version
+                return {
+                    "added": [self._decode(line) for line in added],
+                    "removed": [self._decode(line) for line in removed],
+                }
+            self._stored = None
+
+        raise redis.WatchError("policy in redis kept changing during save_policy_diff")
+
     async def add_policy(self, sec, ptype, rule):
         """Add policy rules to redis
 
@@ -142,8 +541,7 @@ class Adapter(AsyncAdapter):
         Returns:
             bool: True if succeed else False
         """
-        for rule in rules:
-            await self.add_policy(sec, ptype, rule)
+        await self._write([("rpush", self._rule_json(ptype, rule)) for rule in rules])
         return True
 
     async def remove_policy(self, sec, ptype, rule):
@@ -171,8 +569,7 @@ class Adapter(AsyncAdapter):
         Returns:
             bool: True if succeed else False
         """
-        for rule in rules:
-            await self.remove_policy(sec, ptype, rule)
+        await self._write([("lrem", self._rule_json(ptype, rule)) for rule in rules])
         return True
 
     async def remove_filtered_policy(self, sec, ptype, field_index, *field_values):
@@ -193,25 +590,18 @@ class Adapter(AsyncAdapter):
         if not (1 <= field_index + len(field_values) <= 6):
             return False
 
-        length = await self.client.llen(self.key)
-        for i in range(length):
-            line = json.loads(await self.client.lindex(self.key, i))
-            if ptype != line.get("ptype"):
-                continue
-            j = 1
-            is_match = False
-            keys = list(line.keys())[field_index : field_index + len(field_values) + 1]
-            for field_value in field_values:
-                if field_value == line[keys[j]]:
-                    j += 1
-                    if j == len(field_values):
-                        is_match = True
-                else:
-                    break
-            if is_match:
-                await self.client.lset(self.key, i, "__CASBIN_DELETED__")
-
-        await self.client.lrem(self.key, 0, "__CASBIN_DELETED__")
+        await self.flush()
+        result = await self.client.eval(
+            REMOVE_FILTERED_POLICY_SCRIPT,
+            2,
+            self.key,
+            self.version_key,
+            ptype,
+            field_index,
+            *field_values,
+        )
+        version, removed = result[0], result[1:]
+        self._track(version, [("lrem1", line) for line in removed])
         return True
 
     async def update_policy(self, sec, ptype, old_rule, new_rule):
@@ -228,36 +618,24 @@ class Adapter(AsyncAdapter):
         Returns:
             bool: True if succeed else False
         """
-        old_rule_obj = CasbinRule(ptype=ptype)
-        new_rule_obj = CasbinRule(ptype=ptype)
-        for index, value in enumerate(old_rule):
-            setattr(old_rule_obj, f"v{index}", value)
-        for index, value in enumerate(new_rule):
-            setattr(new_rule_obj, f"v{index}", value)
-
-        # Convert old_rule_obj and new_rule_obj to json
-        old_rule_json = json.dumps(old_rule_obj.dict())
-        new_rule_json = json.dumps(new_rule_obj.dict())
-
-        lua_script = """
-            local old_rule_json = ARGV[1]
-            local new_rule_json = ARGV[2]
-            local rules = redis.call('lrange', KEYS[1], 0, -1)
-            for i, rule_json in ipairs(rules) do
-                local rule = cjson.decode(rule_json)
-                if rule.ptype == ARGV[3] and rule_json == old_rule_json then
-                    redis.call('lset', KEYS[1], i-1, new_rule_json)
-                    return 1
-                end
-            end
-            return 0
-            """
+        old_rule_json = self._rule_json(ptype, old_rule)
+        new_rule_json = self._rule_json(ptype, new_rule)
+
+        await self.flush()
 
         result = await self.client.eval(
-            lua_script, 1, self.key, old_rule_json, new_rule_json, ptype
+            UPDATE_POLICY_SCRIPT,
+            2,
+            self.key,
+            self.version_key,
+            old_rule_json,
+            new_rule_json,
+            ptype,
         )
+        if result:
+            self._track(result, [("lrem1", old_rule_json), ("rpush", new_rule_json)])
 
-        return result == 1
+        return bool(result)
 
     async def update_policies(self, sec, ptype, old_rules, new_rules):
         """
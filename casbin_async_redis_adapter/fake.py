@@ -0,0 +1,347 @@
+import asyncio
+import json
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from .adapter import (
+    REMOVE_FILTERED_POLICY_SCRIPT,
+    SAVE_POLICY_DIFF_SCRIPT,
+    UPDATE_POLICY_SCRIPT,
+)
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+COMMANDS = [
+    "delete",
+    "exists",
+    "get",
+    "set",
+    "incr",
+    "llen",
+    "lindex",
+    "lrange",
+    "rpush",
+    "lrem",
+    "lset",
+    "sadd",
+    "srem",
+    "smembers",
+    "scard",
+    "sismember",
+    "hset",
+    "hget",
+    "hgetall",
+    "hdel",
+    "hlen",
+    "xadd",
+    "xrange",
+    "xlen",
+    "eval",
+]
+
+
+def _update_policy(client, keys, args):
+    old_rule_json, new_rule_json, ptype = args
+    for i, rule_json in enumerate(client._lrange(keys[0], 0, -1)):
+        rule = json.loads(rule_json)
+        if rule.get("ptype") == ptype and rule_json == old_rule_json:
+            client._lset(keys[0], i, new_rule_json)
+            return client._incr(keys[1])
+    return 0
+
+
+def _remove_filtered_policy(client, keys, args):
+    ptype, field_index, *field_values = args
+    field_index = int(field_index)
+    kept, removed = [], []
+    for rule_json in client._lrange(keys[0], 0, -1):
+        rule = json.loads(rule_json)
+        values = [rule.get(f"v{field_index + i}") for i in range(len(field_values))]
+        is_match = rule.get("ptype") == ptype and all(
+            isinstance(value, str) and field_value in ("", value)
+            for field_value, value in zip(field_values, values)
+        )
+        (removed if is_match else kept).append(rule_json)
+    if removed:
+        client._delete(keys[0])
+        if kept:
+            client._rpush(keys[0], *kept)
+    return [client._incr(keys[1]), *removed]
+
+
+def _save_policy_diff(client, keys, args):
+    version, removed, *rules = args
+    if (client._get(keys[1]) or "0") != version:
+        return None
+    removed = int(removed)
+    for rule in rules[:removed]:
+        client._lrem(keys[0], 1, rule)
+    if rules[removed:]:
+        client._rpush(keys[0], *rules[removed:])
+    return client._incr(keys[1])
+
+
+SCRIPTS = {
+    UPDATE_POLICY_SCRIPT: _update_policy,
+    REMOVE_FILTERED_POLICY_SCRIPT: _remove_filtered_policy,
+    SAVE_POLICY_DIFF_SCRIPT: _save_policy_diff,
+}
+
+
+class FakeRedis:
+    """
+    In-process stand-in for redis.asyncio.Redis (with decode_responses=True).
+
+    Only the commands the adapter needs are implemented. EVAL runs a Python
+    equivalent registered for the exact script source. Every call, or every
+    executed pipeline, counts as one round trip and sleeps for ``latency``
+    seconds so that benchmarks can model network cost deterministically.
+    Setting ``available`` to False makes every round trip raise ConnectionError.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.available = True
+        self.round_trips = 0
+        self.commands = 0
+        self.scripts = dict(SCRIPTS)
+        self._data = {}
+
+    def register_script(self, script, handler):
+        """Register handler(client, keys, args) as the implementation of a Lua script."""
+        self.scripts[script] = handler
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def aclose(self):
+        pass
+
+    async def _round_trip(self, calls):
+        if not self.available:
+            raise ConnectionError("FakeRedis is unavailable")
+        self.round_trips += 1
+        self.commands += len(calls)
+        await asyncio.sleep(self.latency)
+        results = []
+        error = None
+        for name, args, kwargs in calls:
+            try:
+                results.append(getattr(self, "_" + name)(*args, **kwargs))
+            except ResponseError as e:
+                error = error or e
+                results.append(e)
+        if error is not None:
+            raise error
+        return results
+
+    def _get_typed(self, name, kind):
+        value = self._data.get(name)
+        if value is not None and type(value) is not kind:
+            raise ResponseError(WRONGTYPE)
+        return value
+
+    def _set_typed(self, name, kind):
+        value = self._get_typed(name, kind)
+        if value is None:
+            value = self._data[name] = kind()
+        return value
+
+    def _prune(self, name):
+        if not self._data.get(name):
+            self._data.pop(name, None)
+
+    # keys and strings
+
+    def _delete(self, *names):
+        return sum(self._data.pop(name, None) is not None for name in names)
+
+    def _exists(self, *names):
+        return sum(name in self._data for name in names)
+
+    def _get(self, name):
+        return self._get_typed(name, str)
+
+    def _set(self, name, value):
+        self._data[name] = str(value)
+        return True
+
+    def _incr(self, name, amount=1):
+        value = self._get_typed(name, str) or "0"
+        try:
+            value = int(value) + amount
+        except ValueError:
+            raise ResponseError("ERR value is not an integer or out of range")
+        self._data[name] = str(value)
+        return value
+
+    # lists
+
+    def _llen(self, name):
+        return len(self._get_typed(name, list) or [])
+
+    def _lindex(self, name, index):
+        items = self._get_typed(name, list) or []
+        if -len(items) <= index < len(items):
+            return items[index]
+        return None
+
+    def _lrange(self, name, start, end):
+        items = self._get_typed(name, list) or []
+        if end < 0:
+            end += len(items)
+        return items[start if start >= 0 else max(start + len(items), 0) : end + 1]
+
+    def _rpush(self, name, *values):
+        items = self._set_typed(name, list)
+        items.extend(str(value) for value in values)
+        return len(items)
+
+    def _lrem(self, name, count, value):
+        items = self._get_typed(name, list) or []
+        indexes = [i for i, item in enumerate(items) if item == value]
+        if count < 0:
+            indexes = indexes[::-1][:-count]
+        elif count > 0:
+            indexes = indexes[:count]
+        for i in sorted(indexes, reverse=True):
+            del items[i]
+        self._prune(name)
+        return len(indexes)
+
+    def _lset(self, name, index, value):
+        items = self._get_typed(name, list)
+        if items is None:
+            raise ResponseError("ERR no such key")
+        if not -len(items) <= index < len(items):
+            raise ResponseError("ERR index out of range")
+        items[index] = str(value)
+        return True
+
+    # sets
+
+    def _sadd(self, name, *values):
+        members = self._set_typed(name, set)
+        before = len(members)
+        members.update(str(value) for value in values)
+        return len(members) - before
+
+    def _srem(self, name, *values):
+        members = self._get_typed(name, set) or set()
+        removed = len(members & set(values))
+        members.difference_update(values)
+        self._prune(name)
+        return removed
+
+    def _smembers(self, name):
+        return set(self._get_typed(name, set) or ())
+
+    def _scard(self, name):
+        return len(self._get_typed(name, set) or ())
+
+    def _sismember(self, name, value):
+        return int(value in (self._get_typed(name, set) or ()))
+
+    # hashes
+
+    def _hset(self, name, key=None, value=None, mapping=None):
+        fields = self._set_typed(name, dict)
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        added = len(set(items) - set(fields))
+        fields.update((k, str(v)) for k, v in items.items())
+        return added
+
+    def _hget(self, name, key):
+        return (self._get_typed(name, dict) or {}).get(key)
+
+    def _hgetall(self, name):
+        return dict(self._get_typed(name, dict) or {})
+
+    def _hdel(self, name, *keys):
+        fields = self._get_typed(name, dict) or {}
+        removed = sum(fields.pop(key, None) is not None for key in keys)
+        self._prune(name)
+        return removed
+
+    def _hlen(self, name):
+        return len(self._get_typed(name, dict) or {})
+
+    # streams
+
+    def _xadd(self, name, fields):
+        entries = self._set_typed(name, _Stream)
+        entries.last_id += 1
+        entry_id = f"{entries.last_id}-0"
+        entries.append((entry_id, {k: str(v) for k, v in fields.items()}))
+        return entry_id
+
+    def _xrange(self, name, min="-", max="+", count=None):
+        entries = self._get_typed(name, _Stream) or []
+
+        def seq(entry_id):
+            return int(entry_id.split("-")[0])
+
+        low = 0 if min == "-" else seq(min)
+        high = float("inf") if max == "+" else seq(max)
+        result = [e for e in entries if low <= seq(e[0]) <= high]
+        return result[:count] if count is not None else result
+
+    def _xlen(self, name):
+        return len(self._get_typed(name, _Stream) or [])
+
+    # scripting
+
+    def _eval(self, script, numkeys, *keys_and_args):
+        handler = self.scripts.get(script)
+        if handler is None:
+            raise ResponseError("NOSCRIPT No matching script registered in FakeRedis")
+        return handler(self, keys_and_args[:numkeys], keys_and_args[numkeys:])
+
+
+class _Stream(list):
+    last_id = 0
+
+
+class FakePipeline:
+    """Queues commands and sends them to FakeRedis as a single round trip."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.calls = []
+
+    async def execute(self):
+        calls, self.calls = self.calls, []
+        if not calls:
+            return []
+        return await self.client._round_trip(calls)
+
+
+def _command(name):
+    async def command(self, *args, **kwargs):
+        (result,) = await self._round_trip([(name, args, kwargs)])
+        return result
+
+    command.__name__ = name
+    return command
+
+
+def _queued(name):
+    def command(self, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+        return self
+
+    command.__name__ = name
+    return command
+
+
+for _name in COMMANDS:
+    setattr(FakeRedis, _name, _command(_name))
+    setattr(FakePipeline, _name, _queued(_name))
@@ -0,0 +1,67 @@
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b"CSBNSNP1"
+HEADER = struct.Struct("<8sQI")
+FIELD_COUNT = struct.Struct("<B")
+FIELD_LENGTH = struct.Struct("<I")
+
+
+def write_snapshot(path, version, rules):
+    """Atomically write rules ([ptype, v0, v1, ...] lists) to path.
+
+    Layout: header (magic, policy version, rule count), then per rule a
+    field count followed by length-prefixed UTF-8 fields.
+    """
+    chunks = [HEADER.pack(MAGIC, version, len(rules))]
+    for rule in rules:
+        chunks.append(FIELD_COUNT.pack(len(rule)))
+        for field in rule:
+            field = field.encode("utf-8")
+            chunks.append(FIELD_LENGTH.pack(len(field)))
+            chunks.append(field)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=".casbin-snapshot-"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(chunks))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path):
+    """Memory-map a snapshot written by write_snapshot.
+
+    Returns:
+        (version, rules), or None if the file is missing or not a valid snapshot
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as buf:
+            magic, version, count = HEADER.unpack_from(buf, 0)
+            if magic != MAGIC:
+                return None
+            offset = HEADER.size
+            rules = []
+            for _ in range(count):
+                (fields,) = FIELD_COUNT.unpack_from(buf, offset)
+                offset += FIELD_COUNT.size
+                rule = []
+                for _ in range(fields):
+                    (length,) = FIELD_LENGTH.unpack_from(buf, offset)
+                    offset += FIELD_LENGTH.size
+                    if offset + length > len(buf):
+                        return None
+                    rule.append(buf[offset : offset + length].decode("utf-8"))
+                    offset += length
+                rules.append(rule)
+            return version, rules
+    except (OSError, ValueError, struct.error):
+        return None
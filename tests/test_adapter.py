@@ -1,9 +1,16 @@
 from casbin_async_redis_adapter.adapter import Adapter, CasbinRule
+from casbin_async_redis_adapter.fake import FakeRedis
+from casbin_async_redis_adapter.snapshot import read_snapshot, write_snapshot
 
 from unittest import IsolatedAsyncioTestCase
+from redis.exceptions import ResponseError
+import asyncio
+import gc
+import json
 import redis
 import casbin
 import os
+import tempfile
 
 
 def get_fixture(path):
@@ -14,8 +21,9 @@ def get_fixture(path):
     return os.path.abspath(dir_path + path)
 
 
-async def get_enforcer():
-    adapter = Adapter("localhost", 6379, encoding="utf-8")
+async def get_enforcer(adapter=None):
+    if adapter is None:
+        adapter = Adapter("localhost", 6379, encoding="utf-8")
     e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
     model = e.get_model()
 
@@ -47,7 +55,20 @@ async def get_enforcer():
 
 def clear_db(dbname):
     client = redis.Redis()
-    client.delete(dbname)
+    client.delete(dbname, f"{dbname}:version")
+
+
+async def stored_rules(adapter):
+    return sorted(map(adapter._decode, await adapter.client.lrange(adapter.key, 0, -1)))
+
+
+def model_rules(model):
+    return [
+        [ptype, *rule]
+        for sec in ["p", "g"]
+        for ptype, ast in model.model[sec].items()
+        for rule in ast.policy
+    ]
 
 
 class TestConfig(IsolatedAsyncioTestCase):
@@ -61,11 +82,14 @@ class TestConfig(IsolatedAsyncioTestCase):
     def tearDown(self):
         clear_db("casbin_rules")
 
+    def new_adapter(self):
+        return Adapter("localhost", 6379, encoding="utf-8")
+
     async def test_enforcer_basic(self):
         """
         test policy
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         self.assertTrue(e.enforce("alice", "data1", "read"))
         self.assertFalse(e.enforce("alice", "data1", "write"))
         self.assertFalse(e.enforce("bob", "data2", "read"))
@@ -77,7 +101,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test add_policy
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertTrue(e.enforce("alice", "data1", "read"))
         self.assertFalse(e.enforce("alice", "data1", "write"))
@@ -104,7 +128,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test add_policies
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertTrue(e.enforce("alice", "data1", "read"))
         self.assertFalse(e.enforce("alice", "data1", "write"))
@@ -134,7 +158,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test remove_policy
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertTrue(e.enforce("alice", "data1", "read"))
         self.assertFalse(e.enforce("alice", "data1", "write"))
@@ -163,7 +187,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test remove_policies
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
 
         self.assertFalse(e.enforce("alice", "data3", "write"))
@@ -192,7 +216,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         self.assertTrue(result)
 
     async def test_remove_policy_no_remove_when_rule_is_incomplete(self):
-        adapter = Adapter("localhost", 6379)
+        adapter = self.new_adapter()
         e = casbin.AsyncEnforcer(get_fixture("rbac_with_resources_roles.conf"), adapter)
 
         await adapter.add_policy(sec="p", ptype="p", rule=("alice", "data1", "write"))
@@ -225,7 +249,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         test save_policy
         """
 
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         self.assertFalse(e.enforce("alice", "data4", "read"))
 
         model = e.get_model()
@@ -242,7 +266,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test remove_filtered_policy
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertTrue(e.enforce("alice", "data1", "read"))
         self.assertFalse(e.enforce("alice", "data1", "write"))
@@ -275,11 +299,30 @@ class TestConfig(IsolatedAsyncioTestCase):
         self.assertFalse(e.enforce("alice", "data2", "read"))
         self.assertFalse(e.enforce("alice", "data2", "write"))
 
+    async def test_remove_filtered_policy_with_concurrent_writes(self):
+        """
+        test remove_filtered_policy racing other writes of the same adapter
+        """
+        adapter = self.new_adapter()
+        users = [(f"user{i}", "data", "read") for i in range(20)]
+        await adapter.add_policies(
+            "p", "p", [("target", f"data{i}", "read") for i in range(5)] + users
+        )
+
+        await asyncio.gather(
+            adapter.remove_filtered_policy("p", "p", 0, "target"),
+            *[adapter.remove_policy("p", "p", rule) for rule in users],
+        )
+
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
+        await e.load_policy()
+        self.assertEqual(e.get_policy(), [])
+
     async def test_update_policy(self):
         """
         test update_policy
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertTrue(e.enforce("alice", "data1", "read"))
         self.assertFalse(e.enforce("alice", "data1", "write"))
@@ -312,7 +355,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test update_policies
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertFalse(e.enforce("alice", "data3", "write"))
         self.assertFalse(e.enforce("alice", "data3", "read"))
@@ -346,7 +389,7 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         test update_filtered_policies
         """
-        e = await get_enforcer()
+        e = await get_enforcer(self.new_adapter())
         adapter = e.get_adapter()
         self.assertFalse(e.enforce("alice", "data3", "write"))
         self.assertFalse(e.enforce("alice", "data3", "read"))
@@ -390,6 +433,115 @@ class TestConfig(IsolatedAsyncioTestCase):
         self.assertTrue(e.enforce("alice", "data4", "read"))
         self.assertTrue(result)
 
+    async def test_save_policy_diff(self):
+        """
+        test save_policy_diff
+        """
+        e = await get_enforcer(self.new_adapter())
+        adapter = e.get_adapter()
+        model = e.get_model()
+        model.remove_policy("p", "p", ["bob", "data2", "write"])
+        model.add_policy("p", "p", ["bob", "data3", "read"])
+
+        changes = await adapter.save_policy_diff(model)
+
+        self.assertEqual(changes["added"], [["p", "bob", "data3", "read"]])
+        self.assertEqual(changes["removed"], [["p", "bob", "data2", "write"]])
+        self.assertEqual(await stored_rules(adapter), sorted(model_rules(model)))
+
+        changes = await adapter.save_policy_diff(model)
+        self.assertEqual(changes, {"added": [], "removed": []})
+
+    async def test_save_policy_diff_tracks_own_writes(self):
+        """
+        test save_policy_diff after Auto-Save writes of the same adapter
+        """
+        e = await get_enforcer(self.new_adapter())
+        adapter = e.get_adapter()
+        # loading alone keeps no copy of the stored rules
+        self.assertIsNone(adapter._stored)
+        await adapter.save_policy_diff(e.get_model())
+
+        await e.add_policy("carol", "data1", "read")
+        await e.update_policy(["bob", "data2", "write"], ["bob", "data3", "write"])
+        await e.remove_filtered_policy(0, "data2_admin")
+        e.get_model().add_policy("p", "p", ["dave", "data1", "read"])
+        changes = await adapter.save_policy_diff(e.get_model())
+
+        self.assertEqual(changes["added"], [["p", "dave", "data1", "read"]])
+        self.assertEqual(changes["removed"], [])
+        self.assertEqual(
+            await stored_rules(adapter), sorted(model_rules(e.get_model()))
+        )
+
+    async def test_save_policy_diff_after_racing_filtered_removal(self):
+        """
+        test that the diff base follows what remove_filtered_policy removed
+        """
+        adapter = self.new_adapter()
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
+        users = [[f"user{i}", "data", "read"] for i in range(10)]
+        # the racing removals shift the targets to lower indexes
+        await e.add_policies(users)
+        await e.add_policies([["target", f"data{i}", "read"] for i in range(5)])
+        await adapter.save_policy_diff(e.get_model())
+
+        async def other_writes():
+            for i, rule in enumerate(users[:5]):
+                await adapter.remove_policy("p", "p", rule)
+                await adapter.add_policy("p", "p", [f"new{i}", "data", "read"])
+
+        await asyncio.gather(
+            adapter.remove_filtered_policy("p", "p", 0, "target"), other_writes()
+        )
+        model = e.get_model()
+        model.clear_policy()
+        for rule in users[5:]:
+            model.add_policy("p", "p", rule)
+        changes = await adapter.save_policy_diff(model)
+
+        self.assertEqual(changes["added"], [])
+        self.assertEqual(
+            sorted(changes["removed"]),
+            [["p", f"new{i}", "data", "read"] for i in range(5)],
+        )
+        self.assertEqual(await stored_rules(adapter), sorted(model_rules(model)))
+
+    async def test_save_policy_diff_after_concurrent_write(self):
+        """
+        test save_policy_diff when another writer changed the policy
+        """
+        e = await get_enforcer(self.new_adapter())
+        adapter = e.get_adapter()
+        await adapter.save_policy_diff(e.get_model())
+        await self.new_adapter().add_policy("p", "p", ("eve", "data1", "read"))
+        await self.new_adapter().add_policy("p", "p", ("bob", "data2", "write"))
+
+        model = e.get_model()
+        model.add_policy("p", "p", ["bob", "data3", "read"])
+        changes = await adapter.save_policy_diff(model)
+
+        self.assertEqual(changes["added"], [["p", "bob", "data3", "read"]])
+        self.assertEqual(
+            sorted(changes["removed"]),
+            [["p", "bob", "data2", "write"], ["p", "eve", "data1", "read"]],
+        )
+        self.assertEqual(await stored_rules(adapter), sorted(model_rules(model)))
+
+    async def test_save_policy_diff_without_load(self):
+        """
+        test save_policy_diff on an adapter that never loaded the policy
+        """
+        await get_enforcer(self.new_adapter())
+        adapter = self.new_adapter()
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
+        e.get_model().add_policy("p", "p", ["alice", "data1", "read"])
+
+        changes = await adapter.save_policy_diff(e.get_model())
+        self.assertEqual(changes["added"], [])
+        self.assertEqual(len(changes["removed"]), 4)
+        self.assertEqual(await stored_rules(adapter), [["p", "alice", "data1", "read"]])
+
     def test_str(self):
         """
         test __str__ function
@@ -412,3 +564,330 @@ class TestConfig(IsolatedAsyncioTestCase):
         """
         rule = CasbinRule(ptype="p", v0="alice", v1="data1", v2="read")
         self.assertEqual(repr(rule), '<CasbinRule :"p, alice, data1, read">')
+
+
+class TestFakeConfig(TestConfig):
+    """
+    run the same unittest against the in-process FakeRedis backend
+    """
+
+    def setUp(self):
+        self.client = FakeRedis()
+
+    def tearDown(self):
+        pass
+
+    def new_adapter(self):
+        return Adapter(client=self.client)
+
+    async def test_save_policy_diff_round_trips(self):
+        e = await get_enforcer(self.new_adapter())
+        adapter = e.get_adapter()
+        e.get_model().add_policy("p", "p", ["bob", "data3", "read"])
+
+        self.client.round_trips = 0
+        await adapter.save_policy_diff(e.get_model())
+        # the first call fetches the stored rules to diff against
+        self.assertEqual(self.client.round_trips, 2)
+
+        await e.add_policy("carol", "data1", "read")
+        e.get_model().add_policy("p", "p", ["dave", "data1", "read"])
+        self.client.round_trips = 0
+        await adapter.save_policy_diff(e.get_model())
+        self.assertEqual(self.client.round_trips, 1)
+
+
+class TestBatchConfig(TestFakeConfig):
+    """
+    run the same unittest with write-behind Auto-Save batching enabled
+    """
+
+    def new_adapter(self):
+        return Adapter(client=self.client, batch_interval=0.01)
+
+    async def test_batch_coalesces_mutations(self):
+        adapter = self.new_adapter()
+        await adapter.add_policy("p", "p", ("alice", "data1", "read"))
+        self.client.round_trips = self.client.commands = 0
+
+        await asyncio.gather(
+            adapter.add_policy("p", "p", ("bob", "data1", "read")),
+            adapter.add_policy("p", "p", ("bob", "data2", "read")),
+            adapter.remove_policy("p", "p", ("alice", "data1", "read")),
+            adapter.add_policy("p", "p", ("alice", "data1", "read")),
+            adapter.add_policy("p", "p", ("carol", "data1", "read")),
+            adapter.remove_policy("p", "p", ("carol", "data1", "read")),
+        )
+
+        self.assertEqual(self.client.round_trips, 1)
+        # rpush bob x2, lrem alice, rpush alice, lrem carol, incr version
+        self.assertEqual(self.client.commands, 5)
+        self.assertEqual(
+            [
+                json.loads(line)["v0"]
+                for line in self.client._lrange(adapter.key, 0, -1)
+            ],
+            ["bob", "bob", "alice"],
+        )
+
+    async def test_batch_size_flushes_early(self):
+        adapter = Adapter(client=self.client, batch_interval=60, batch_size=2)
+        await asyncio.wait_for(
+            adapter.add_policies(
+                "p", "p", [("alice", "data1", "read"), ("bob", "data1", "read")]
+            ),
+            timeout=1,
+        )
+        self.assertEqual(self.client._llen(adapter.key), 2)
+
+    async def test_batch_failure_reaches_callers(self):
+        adapter = self.new_adapter()
+        await self.client.set(adapter.key, "not a list")
+        results = await asyncio.gather(
+            adapter.add_policy("p", "p", ("alice", "data1", "read")),
+            adapter.remove_policy("p", "p", ("bob", "data1", "read")),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(r, ResponseError) for r in results))
+
+    async def test_cancelled_caller_does_not_drop_batch(self):
+        self.client.latency = 0.05
+        adapter = Adapter(client=self.client, batch_interval=60, batch_size=2)
+        other = asyncio.ensure_future(
+            adapter.add_policy("p", "p", ("alice", "data1", "read"))
+        )
+        await asyncio.sleep(0)
+        # this call triggers the commit and is cancelled while it is in flight
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                adapter.add_policy("p", "p", ("bob", "data1", "read")), timeout=0.01
+            )
+        self.assertTrue(await asyncio.wait_for(other, timeout=1))
+        self.assertEqual(self.client._llen(adapter.key), 2)
+
+    async def test_cancelled_flush_does_not_drop_batch(self):
+        self.client.latency = 0.05
+        adapter = Adapter(client=self.client, batch_interval=60)
+        pending = asyncio.ensure_future(
+            adapter.add_policy("p", "p", ("alice", "data1", "read"))
+        )
+        await asyncio.sleep(0)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(adapter.flush(), timeout=0.01)
+        self.assertTrue(await asyncio.wait_for(pending, timeout=1))
+        self.assertEqual(self.client._llen(adapter.key), 1)
+
+    async def test_flush_leaves_commit_errors_to_writers(self):
+        adapter = Adapter(client=self.client, batch_interval=60)
+        await self.client.set(adapter.key, "not a list")
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+
+        writer = asyncio.ensure_future(
+            adapter.add_policy("p", "p", ("alice", "data1", "read"))
+        )
+        await asyncio.sleep(0)
+        writer.cancel()
+        batch = adapter._batch
+        await adapter.flush()
+        self.assertIsInstance(batch.future.exception(), ResponseError)
+
+        del writer, batch
+        gc.collect()
+        self.assertEqual(errors, [])
+
+    async def test_batch_coalescing_is_linear(self):
+        adapter = Adapter(client=self.client, batch_interval=60)
+        rules = [("user%d" % (i % 100), "data", "read") for i in range(20000)]
+        writer = asyncio.ensure_future(adapter.remove_policies("p", "p", rules))
+        await asyncio.sleep(0)
+
+        # each removal replaces the earlier one of its rule instead of piling up
+        batch = adapter._batch
+        self.assertEqual(batch.count, 20000)
+        self.assertEqual(len(batch.ops), 100)
+        self.assertTrue(all(len(keys) == 1 for keys in batch.positions.values()))
+
+        self.client.commands = 0
+        await adapter.flush()
+        self.assertTrue(await writer)
+        # 100 LREM and the version INCR
+        self.assertEqual(self.client.commands, 101)
+
+
+class TestSnapshot(IsolatedAsyncioTestCase):
+    """
+    unittest of the local policy snapshot
+    """
+
+    def setUp(self):
+        self.client = FakeRedis()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "policy.snapshot")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def new_adapter(self, **kwargs):
+        return Adapter(client=self.client, snapshot_path=self.path, **kwargs)
+
+    async def test_snapshot_round_trip(self):
+        rules = [["p", "alice", "data1", "read"], ["g", "alice", "管理员"]]
+        write_snapshot(self.path, 7, rules)
+        self.assertEqual(read_snapshot(self.path), (7, rules))
+
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertIsNone(read_snapshot(self.path))
+        self.assertIsNone(read_snapshot(self.path + ".missing"))
+
+    async def test_cold_start_from_snapshot(self):
+        e = await get_enforcer(self.new_adapter())
+        self.assertTrue(os.path.exists(self.path))
+
+        self.client.round_trips = 0
+        e = casbin.AsyncEnforcer(
+            get_fixture("rbac_model.conf"),
+            self.new_adapter(on_stale_snapshot=lambda: asyncio.sleep(0)),
+        )
+        await e.load_policy()
+        self.assertEqual(self.client.round_trips, 0)
+        self.assertTrue(e.enforce("alice", "data2", "write"))
+        self.assertTrue(await e.get_adapter().reconcile_task)
+
+    async def test_cold_start_without_callback_reads_redis(self):
+        await get_enforcer(self.new_adapter())
+        await self.new_adapter().add_policy("p", "p", ("carol", "data1", "read"))
+
+        # a stale snapshot could never be replaced, so it is not served at all
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), self.new_adapter())
+        await e.load_policy()
+        self.assertTrue(e.enforce("carol", "data1", "read"))
+        self.assertIsNone(e.get_adapter().reconcile_task)
+
+    async def test_failing_callback_is_retried(self):
+        await get_enforcer(self.new_adapter())
+        await self.new_adapter().add_policy("p", "p", ("carol", "data1", "read"))
+
+        calls = []
+
+        async def reload():
+            calls.append(True)
+            if len(calls) == 1:
+                raise RuntimeError("reload failed")
+
+        adapter = self.new_adapter(on_stale_snapshot=reload)
+        adapter.reconcile_backoff = 0.01
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
+        with self.assertLogs("casbin_async_redis_adapter.adapter", "ERROR"):
+            await e.load_policy()
+            self.assertFalse(await adapter.reconcile_task)
+        self.assertEqual(len(calls), 2)
+
+    async def test_stale_snapshot_reloads(self):
+        await get_enforcer(self.new_adapter())
+        await self.new_adapter().add_policy("p", "p", ("carol", "data1", "read"))
+
+        reloaded = asyncio.Event()
+        e = casbin.AsyncEnforcer(
+            get_fixture("rbac_model.conf"),
+            self.new_adapter(on_stale_snapshot=lambda: reload()),
+        )
+
+        async def reload():
+            await e.load_policy()
+            reloaded.set()
+
+        await e.load_policy()
+        self.assertFalse(e.enforce("carol", "data1", "read"))
+        self.assertFalse(await e.get_adapter().reconcile_task)
+        await reloaded.wait()
+        self.assertTrue(e.enforce("carol", "data1", "read"))
+
+    async def test_redis_outage_falls_back_to_snapshot(self):
+        adapter = self.new_adapter(on_stale_snapshot=lambda: asyncio.sleep(0))
+        e = await get_enforcer(adapter)
+
+        self.client.available = False
+        await e.load_policy()
+        self.assertTrue(e.enforce("alice", "data2", "write"))
+
+        os.remove(self.path)
+        with self.assertRaises(redis.ConnectionError):
+            await e.load_policy()
+        adapter.reconcile_task.cancel()
+
+    async def redis_comes_back_newer(self, adapter):
+        # written while unreachable, as another worker would have done
+        await asyncio.sleep(0.05)
+        rule = {"ptype": "p", "v0": "carol", "v1": "data1", "v2": "read"}
+        self.client._rpush(adapter.key, json.dumps(rule))
+        self.client._incr(adapter.version_key)
+        self.client.available = True
+
+    async def test_cold_start_while_redis_is_down(self):
+        await get_enforcer(self.new_adapter())
+        self.client.available = False
+
+        reloaded = asyncio.Event()
+        adapter = self.new_adapter(on_stale_snapshot=lambda: reload())
+        adapter.reconcile_backoff = 0.01
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
+
+        async def reload():
+            await e.load_policy()
+            reloaded.set()
+
+        await e.load_policy()
+        self.assertFalse(e.enforce("carol", "data1", "read"))
+
+        await self.redis_comes_back_newer(adapter)
+        await asyncio.wait_for(reloaded.wait(), timeout=1)
+        self.assertFalse(await adapter.reconcile_task)
+        self.assertTrue(e.enforce("carol", "data1", "read"))
+        self.assertEqual(read_snapshot(self.path)[0], 6)
+
+    async def test_outage_fallback_reconciles(self):
+        reloaded = asyncio.Event()
+        adapter = self.new_adapter(on_stale_snapshot=lambda: reload())
+        adapter.reconcile_backoff = 0.01
+        e = await get_enforcer(adapter)
+
+        async def reload():
+            await e.load_policy()
+            reloaded.set()
+
+        self.client.available = False
+        await e.load_policy()
+        self.assertFalse(e.enforce("carol", "data1", "read"))
+
+        await self.redis_comes_back_newer(adapter)
+        await asyncio.wait_for(reloaded.wait(), timeout=1)
+        self.assertTrue(e.enforce("carol", "data1", "read"))
+
+    async def test_load_is_one_consistent_read(self):
+        adapter = self.new_adapter()
+        await get_enforcer(adapter)
+        self.client.round_trips = 0
+        e = casbin.AsyncEnforcer(get_fixture("rbac_model.conf"), adapter)
+        await e.load_policy()
+        self.assertEqual(self.client.round_trips, 1)
+        self.assertEqual(read_snapshot(self.path)[0], 5)
+
+
+class TestInternConfig(TestFakeConfig):
+    """
+    run the same unittest with interned rule loading
+    """
+
+    def new_adapter(self):
+        return Adapter(client=self.client, intern_strings=True)
+
+    async def test_fields_are_shared(self):
+        e = await get_enforcer(self.new_adapter())
+        policy = e.get_model().get_policy("p", "p")
+        self.assertEqual(policy[2], ["data2_admin", "data2", "read"])
+        self.assertIs(policy[1][1], policy[2][1])
+        self.assertIs(policy[2][0], policy[3][0])
@@ -0,0 +1,238 @@
+from casbin_async_redis_adapter.adapter import Adapter, UPDATE_POLICY_SCRIPT
+from casbin_async_redis_adapter.fake import FakeRedis
+from tests.test_adapter import get_fixture
+
+from unittest import IsolatedAsyncioTestCase
+from redis.exceptions import ResponseError
+from casbin import model as casbin_model
+import json
+import random
+import time
+
+
+def new_model():
+    m = casbin_model.Model()
+    m.load_model(get_fixture("rbac_with_resources_roles.conf"))
+    return m
+
+
+def stored_rules(client, key="casbin_rules"):
+    rules = []
+    for line in client._lrange(key, 0, -1):
+        line = json.loads(line)
+        ptype = line.pop("ptype")
+        rules.append((ptype, tuple(line.values())))
+    return rules
+
+
+class TestFakeRedis(IsolatedAsyncioTestCase):
+    """
+    unittest of the in-process backend itself
+    """
+
+    async def test_list_commands(self):
+        client = FakeRedis()
+        self.assertEqual(await client.rpush("k", "a", "b", "a", "c"), 4)
+        self.assertEqual(await client.llen("k"), 4)
+        self.assertEqual(await client.lindex("k", -1), "c")
+        self.assertIsNone(await client.lindex("k", 4))
+        self.assertEqual(await client.lrange("k", 1, -2), ["b", "a"])
+        self.assertEqual(await client.lrem("k", 0, "a"), 2)
+        await client.lset("k", 0, "x")
+        self.assertEqual(await client.lrange("k", 0, -1), ["x", "c"])
+        with self.assertRaises(ResponseError):
+            await client.lset("k", 5, "y")
+        self.assertEqual(await client.delete("k"), 1)
+        self.assertEqual(await client.exists("k"), 0)
+
+    async def test_wrong_type(self):
+        client = FakeRedis()
+        await client.sadd("s", "a")
+        with self.assertRaises(ResponseError):
+            await client.rpush("s", "a")
+
+    async def test_set_hash_stream_commands(self):
+        client = FakeRedis()
+        self.assertEqual(await client.sadd("s", "a", "b", "a"), 2)
+        self.assertEqual(await client.smembers("s"), {"a", "b"})
+        self.assertEqual(await client.srem("s", "a", "z"), 1)
+        self.assertEqual(await client.hset("h", mapping={"a": 1, "b": 2}), 2)
+        self.assertEqual(await client.hget("h", "a"), "1")
+        self.assertEqual(await client.hdel("h", "a"), 1)
+        self.assertEqual(await client.hgetall("h"), {"b": "2"})
+        first = await client.xadd("x", {"op": "add"})
+        await client.xadd("x", {"op": "remove"})
+        self.assertEqual(await client.xlen("x"), 2)
+        self.assertEqual(await client.xrange("x", count=1), [(first, {"op": "add"})])
+
+    async def test_eval(self):
+        client = FakeRedis()
+        await client.rpush("k", '{"ptype": "p", "v0": "a"}')
+        result = await client.eval(
+            UPDATE_POLICY_SCRIPT,
+            2,
+            "k",
+            "k:version",
+            '{"ptype": "p", "v0": "a"}',
+            '{"ptype": "p", "v0": "b"}',
+            "p",
+        )
+        self.assertEqual(result, 1)
+        self.assertEqual(await client.get("k:version"), "1")
+        self.assertEqual(await client.lrange("k", 0, -1), ['{"ptype": "p", "v0": "b"}'])
+        with self.assertRaises(ResponseError):
+            await client.eval("return 1", 0)
+
+    async def test_round_trips(self):
+        client = FakeRedis()
+        adapter = Adapter(client=client)
+        await adapter.add_policies("p", "p", [("a", "d", "r"), ("b", "d", "w")])
+        # one RPUSH for both rules and the version bump, in one transaction
+        self.assertEqual(client.round_trips, 1)
+        self.assertEqual(client.commands, 2)
+
+        async with client.pipeline() as pipe:
+            pipe.rpush("k", "a").rpush("k", "b").llen("k")
+            self.assertEqual(await pipe.execute(), [1, 2, 2])
+        self.assertEqual(client.round_trips, 2)
+        self.assertEqual(client.commands, 5)
+
+    async def test_latency(self):
+        client = FakeRedis(latency=0.01)
+        start = time.monotonic()
+        await client.llen("k")
+        await client.llen("k")
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+
+
+class TestReferenceModel(IsolatedAsyncioTestCase):
+    """
+    random Adapter operations must leave redis in the same state as a plain list
+    """
+
+    async def test_equivalence(self):
+        rng = random.Random(0)
+        client = FakeRedis()
+        adapter = Adapter(client=client)
+        reference = []
+
+        def random_rule(ptype):
+            if ptype == "p":
+                return (
+                    rng.choice(["alice", "bob", "admin"]),
+                    rng.choice(["data1", "data2"]),
+                    rng.choice(["read", "write"]),
+                )
+            return (rng.choice(["alice", "bob"]), rng.choice(["admin", "group"]))
+
+        def random_rules(ptype):
+            return [random_rule(ptype) for _ in range(rng.randint(0, 3))]
+
+        def random_filter(ptype):
+            field_index = rng.randint(0, 2)
+            sample = random_rule(ptype)[field_index:] or ("alice",)
+            field_values = list(sample[: rng.randint(1, 2)])
+            if rng.random() < 0.2:
+                field_values[0] = ""
+            return field_index, field_values
+
+        def matches(entry, ptype, field_index, field_values):
+            values = entry[1][field_index:]
+            return (
+                entry[0] == ptype
+                and len(values) >= len(field_values)
+                and all(f == "" or f == v for f, v in zip(field_values, values))
+            )
+
+        def update(ptype, old_rule, new_rule):
+            if (ptype, old_rule) not in reference:
+                return False
+            reference[reference.index((ptype, old_rule))] = (ptype, new_rule)
+            return True
+
+        ops = [
+            "add",
+            "add_many",
+            "remove",
+            "remove_many",
+            "remove_filtered",
+            "update",
+            "update_many",
+            "update_filtered",
+            "save",
+        ]
+        for _ in range(400):
+            op = rng.choice(ops)
+            ptype = rng.choice(["p", "g", "g2"])
+            sec = ptype[0]
+            if op == "add":
+                rule = random_rule(ptype)
+                self.assertTrue(await adapter.add_policy(sec, ptype, rule))
+                reference.append((ptype, rule))
+            elif op == "add_many":
+                rules = random_rules(ptype)
+                self.assertTrue(await adapter.add_policies(sec, ptype, rules))
+                reference.extend((ptype, rule) for rule in rules)
+            elif op == "remove":
+                rule = random_rule(ptype)
+                self.assertTrue(await adapter.remove_policy(sec, ptype, rule))
+                reference = [r for r in reference if r != (ptype, rule)]
+            elif op == "remove_many":
+                rules = random_rules(ptype)
+                self.assertTrue(await adapter.remove_policies(sec, ptype, rules))
+                reference = [r for r in reference if r[0] != ptype or r[1] not in rules]
+            elif op == "remove_filtered":
+                field_index, field_values = random_filter(ptype)
+                self.assertTrue(
+                    await adapter.remove_filtered_policy(
+                        sec, ptype, field_index, *field_values
+                    )
+                )
+                reference = [
+                    r
+                    for r in reference
+                    if not matches(r, ptype, field_index, field_values)
+                ]
+            elif op == "update":
+                old_rule, new_rule = random_rule(ptype), random_rule(ptype)
+                result = await adapter.update_policy(sec, ptype, old_rule, new_rule)
+                self.assertEqual(result, update(ptype, old_rule, new_rule))
+            elif op == "update_many":
+                old_rules = random_rules(ptype)
+                new_rules = [random_rule(ptype) for _ in old_rules]
+                self.assertTrue(
+                    await adapter.update_policies(sec, ptype, old_rules, new_rules)
+                )
+                for old_rule, new_rule in zip(old_rules, new_rules):
+                    update(ptype, old_rule, new_rule)
+            elif op == "update_filtered":
+                field_index, field_values = random_filter(ptype)
+                new_rules = random_rules(ptype)
+                self.assertTrue(
+                    await adapter.update_filtered_policies(
+                        sec, ptype, new_rules, field_index, *field_values
+                    )
+                )
+                reference = [
+                    r
+                    for r in reference
+                    if not matches(r, ptype, field_index, field_values)
+                ]
+                reference.extend((ptype, rule) for rule in new_rules)
+            else:
+                m = new_model()
+                rules = random_rules(ptype)
+                for rule in rules:
+                    # the model itself drops duplicate rules
+                    if m.add_policy(sec, ptype, list(rule)):
+                        reference.append((ptype, rule))
+                self.assertTrue(await adapter.save_policy(m))
+            self.assertEqual(stored_rules(client), reference, op)
+
+        m = new_model()
+        await adapter.load_policy(m)
+        for ptype in ["p", "g", "g2"]:
+            self.assertEqual(
+                m.get_policy(ptype[0], ptype),
+                [list(rule) for t, rule in reference if t == ptype],
+            )